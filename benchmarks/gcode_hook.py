@@ -0,0 +1,108 @@
+# coding=utf-8
+"""
+Times the per-line overhead of the plugin's "octoprint.comm.protocol.gcode.sent" hook.
+
+Runs standalone from the repository root:
+
+    python benchmarks/gcode_hook.py
+
+OctoPrint and flask are stubbed if they aren't installed, and the display calls are replaced
+with no-ops, so only the hook's own dispatch and parsing are measured. The pre-dispatch-table
+hook is included for comparison.
+"""
+from __future__ import print_function
+
+import logging
+import os
+import re
+import sys
+import timeit
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+try:
+    import octoprint.plugin
+except ImportError:
+    octoprint = types.ModuleType("octoprint")
+    octoprint.plugin = types.ModuleType("octoprint.plugin")
+    for name in ["SettingsPlugin", "StartupPlugin", "TemplatePlugin", "AssetPlugin",
+                 "SimpleApiPlugin", "EventHandlerPlugin", "ProgressPlugin"]:
+        setattr(octoprint.plugin, name, type(name, (object,), {}))
+    sys.modules["octoprint"] = octoprint
+    sys.modules["octoprint.plugin"] = octoprint.plugin
+
+try:
+    import flask
+except ImportError:
+    sys.modules["flask"] = types.ModuleType("flask")
+
+import octoprint_StatusOLED
+
+LINES_PER_RUN = 100
+RUNS = 200
+REPEAT = 15
+
+G1_STREAM = [("G1 X10.5 Y20.1 E0.123", "G1")] * LINES_PER_RUN
+MIXED_STREAM = [("G1 X10.5 Y20.1 E0.123", "G1")] * 95 + [
+    ("M104 S200", "M104"),
+    ("N12 ; not a command", None),
+    ("G92 E0", "G92"),
+    ("M117 Layer 4", "M117"),
+    ("M73 P40 R12", "M73"),
+]
+
+class _Settings():
+    def get_boolean(self, path):
+        return {"m73_progress": True, "m118_messages": True}[path[-1]]
+
+class _Image():
+    def show_progress(self, progress = None):
+        pass
+
+def _make_plugin():
+    plugin = octoprint_StatusOLED.StatusOledPlugin()
+    plugin._settings = _Settings()
+    plugin._logger = logging.getLogger("benchmark")
+    plugin._img = _Image()
+    plugin._show_message = lambda code, text: None
+    plugin._update_active_displays = lambda: None
+    plugin.sendRemainingToFrontend = lambda minutes: None
+    plugin._update_gcode_handlers()
+    return plugin
+
+def _make_baseline_hook(plugin):
+    # the hook as it was before the dispatch table
+    def sent_m117(comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+        if gcode and gcode.upper() == "M117":
+            text = ""
+            match = re.search(r"M117\s+(.*)", cmd, re.I)
+            if match is not None:
+                text = match.group(1)
+            plugin._show_message("M117", text)
+    return sent_m117
+
+def _run(hook, lines):
+    for cmd, gcode in lines:
+        hook(None, "sent", cmd, None, gcode)
+
+def main():
+    plugin = _make_plugin()
+    hooks = [("baseline", _make_baseline_hook(plugin)), ("sent_gcode", plugin.sent_gcode)]
+    streams = [("G1 only", G1_STREAM), ("mixed", MIXED_STREAM)]
+
+    # interleave the cases on every repeat so they all see the same machine noise
+    cases = [(hook_name, hook, stream_name, lines) for stream_name, lines in streams for hook_name, hook in hooks]
+    best = [None] * len(cases)
+    for _ in range(REPEAT):
+        for index, (hook_name, hook, stream_name, lines) in enumerate(cases):
+            elapsed = timeit.timeit(lambda: _run(hook, lines), number=RUNS)
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+
+    for (hook_name, hook, stream_name, lines), elapsed in zip(cases, best):
+        per_line = elapsed / (RUNS * len(lines))
+        print("%-10s %-8s %6.0f ns/line  (%.2f ms of CPU per 5000 lines)" % (
+            hook_name, stream_name, per_line * 1e9, per_line * 5000 * 1e3))
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@ from __future__ import absolute_import
 
 from octoprint_StatusOLED import (
     settings,
-    displays
+    displays,
+    prerender
 )
 
 import octoprint.plugin
@@ -12,6 +13,11 @@ import flask
 import time
 import re
 
+# Precompiled patterns for the G-code commands handled by the sent hook
+M117_REGEX = re.compile(r"M117\s+(.*)", re.I)
+M118_REGEX = re.compile(r"M118(?:\s+(?:A1|E1|P\d)\b)*\s*(.*)", re.I)
+M73_PARAM_REGEX = re.compile(r"\s([PR])\s*(\d+(?:\.\d*)?)", re.I)
+
 class StatusOledPlugin(
     octoprint.plugin.SettingsPlugin,
     octoprint.plugin.StartupPlugin,
@@ -28,6 +34,10 @@ class StatusOledPlugin(
         self._img = None
         self.hw_display = None
         self.sw_display = None
+        self._gcode_handlers = {}
+        self._slicer_progress = False
+        self._slicer_remaining = None
+        self._prerenderer = None
 
     ##~~ SettingsPlugin mixin
 
@@ -64,6 +74,7 @@ class StatusOledPlugin(
             self._settings.get_int(["display", "progress_bar", "size"]),
             self._printer
         )
+        self._prerenderer = prerender.MessagePrerenderer(self._img)
 
         self.hw_display = displays.HardwareDisplay(
             self._img,
@@ -73,14 +84,19 @@ class StatusOledPlugin(
         self.sw_display = displays.SoftwareDisplay(
             self._img,
             self.sendDisplayToFrontend,
-            self._settings.get_boolean(["software_display", "enabled"])
+            self._settings.get_boolean(["software_display", "enabled"]),
+            self.sendStateToFrontend,
+            self._settings.get_boolean(["software_display", "client_rendering"])
         )
 
         debugEnabled = self._settings.get_boolean(["debug"])
         self._img.debug(debugEnabled)
+        self._prerenderer.debug(debugEnabled)
         self.hw_display.debug(debugEnabled)
         self.sw_display.debug(debugEnabled)
 
+        self._update_gcode_handlers()
+
     def on_settings_save(self, data):
         octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
         self._img.set_settings(
@@ -99,8 +115,10 @@ class StatusOledPlugin(
             self._settings.get_boolean(["hardware_display", "rotated_180"])
         )
         self.sw_display.set_settings(
-            self._settings.get_boolean(["software_display", "enabled"])
+            self._settings.get_boolean(["software_display", "enabled"]),
+            self._settings.get_boolean(["software_display", "client_rendering"])
         )
+        self._update_gcode_handlers()
 
     def _update_active_displays(self):
         [display.update() for display in [self.hw_display, self.sw_display] if display is not None and display.is_enabled()]
@@ -108,6 +126,12 @@ class StatusOledPlugin(
     def _clear_all_displays(self):
         [display.clear() for display in [self.hw_display, self.sw_display] if display is not None]
 
+    def _animation_signal(self):
+        # only animate on the server when an enabled display is sent its frames
+        if any([display.needs_frames() for display in [self.hw_display, self.sw_display] if display is not None]):
+            return self._update_active_displays
+        return None
+
     ##~~ TemplatePlugin mixin
 
     def get_template_vars(self):
@@ -135,6 +159,8 @@ class StatusOledPlugin(
         
         img = self._img
         args = request.args
+        if "state" in args:
+            return flask.jsonify(img.get_state())
         if "sample" in args and "font_name" in args and "font_size" in args:
             sec_font_name = args["sec_font_name"] if "sec_font_name" in args else None
             sec_font_size = args["sec_font_size"] if "sec_font_size" in args else None
@@ -171,6 +197,11 @@ class StatusOledPlugin(
 
     ##~~ ProgressPlugin
     def on_print_progress(self, storage, path, progress):
+        if self._prerenderer is not None:
+            self._prerenderer.print_progress(progress)
+        if self._slicer_progress:
+            # M73 progress reported by the slicer is more accurate than the file position
+            return
         self._img.show_progress(progress)
         self._update_active_displays()
 
@@ -183,28 +214,97 @@ class StatusOledPlugin(
     def sendSampleDisplayToFrontend(self, data):
         self.sendDisplayToFrontend(data, True)
 
+    def sendStateToFrontend(self, state):
+        self._plugin_manager.send_plugin_message(self._identifier, { "state": state, "isSample": False })
+
+    def sendRemainingToFrontend(self, minutes):
+        self._plugin_manager.send_plugin_message(self._identifier, { "remaining": minutes, "isSample": False })
+
     ##~~ GCode Phase hook
 
-    def sent_m117(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
-        if gcode and gcode.upper() == "M117":
-            text = ""
-            match = re.search("M117\s+(.*)", cmd, re.I)
-            if match is not None:
-                text = match.group(1)
-            if text == "":
-                self._logger.info("Handling empty M117 command, clearing display")
-                self._clear_all_displays()
-            else:
-                self._logger.info("Handling M117 command to display '%s'" % text)
-                self._img.show_text(text, self._update_active_displays)
-                self._img.show_progress()
-                self._update_active_displays()
+    def _update_gcode_handlers(self):
+        handlers = { "M117": self._handle_m117 }
+        if self._settings.get_boolean(["gcode", "m73_progress"]):
+            handlers["M73"] = self._handle_m73
+        else:
+            # hand the progress bar back to OctoPrint if M73 is turned off mid-print
+            self._slicer_progress = False
+            self._set_slicer_remaining(None)
+        if self._settings.get_boolean(["gcode", "m118_messages"]):
+            handlers["M118"] = self._handle_m118
+
+        # match the parsed command in either case without normalizing every line
+        handlers.update({ code.lower(): handler for code, handler in list(handlers.items()) })
+        self._gcode_handlers = handlers
+
+    def sent_gcode(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+        handler = self._gcode_handlers.get(gcode)
+        if handler is not None:
+            handler(cmd)
+
+    def _handle_m117(self, cmd):
+        match = M117_REGEX.search(cmd)
+        self._show_message("M117", match.group(1) if match is not None else "")
+
+    def _handle_m118(self, cmd):
+        match = M118_REGEX.search(cmd)
+        self._show_message("M118", match.group(1) if match is not None else "")
+
+    def _handle_m73(self, cmd):
+        params = { key.upper(): float(value) for key, value in M73_PARAM_REGEX.findall(cmd) }
+        if "R" in params:
+            self._set_slicer_remaining(params["R"])
+        if "P" in params:
+            self._slicer_progress = True
+            self._img.show_progress(params["P"])
+            self._update_active_displays()
+
+    def _set_slicer_remaining(self, minutes):
+        # the minutes remaining are shown by the web display, send them only when they change
+        if minutes == self._slicer_remaining:
+            return
+        self._slicer_remaining = minutes
+        self.sendRemainingToFrontend(minutes)
+
+    def _show_message(self, code, text):
+        if text == "":
+            self._logger.info("Handling empty %s command, clearing display" % code)
+            self._clear_all_displays()
+        else:
+            self._logger.info("Handling %s command to display '%s'" % (code, text))
+            self._img.show_text(text, self._animation_signal())
+            self._img.show_progress()
+            self._update_active_displays()
+            if code == "M117" and self._prerenderer is not None:
+                self._prerenderer.message_shown(text)
 
     ##~~ EventHandlerPlugin
 
     def on_event(self, event, payload):
         if event == "Shutdown":
+            self._stop_prerender()
             self._clear_all_displays()
+        elif event == "PrintStarted":
+            self._slicer_progress = False
+            self._set_slicer_remaining(None)
+            self._start_prerender(payload)
+        elif event in ["PrintDone", "PrintFailed", "PrintCancelled"]:
+            self._set_slicer_remaining(None)
+            self._stop_prerender()
+
+    ##~~ M117 Pre-rendering
+
+    def _start_prerender(self, payload):
+        if self._prerenderer is None:
+            return
+        if payload.get("origin") != "local":
+            self._prerenderer.stop()
+            return
+        self._prerenderer.start(self._file_manager.path_on_disk("local", payload["path"]))
+
+    def _stop_prerender(self):
+        if self._prerenderer is not None:
+            self._prerenderer.stop()
 
 	##~~ Softwareupdate hook
 
@@ -246,5 +346,5 @@ def __plugin_load__():
     global __plugin_hooks__
     __plugin_hooks__ = {
         "octoprint.plugin.softwareupdate.check_config": __plugin_implementation__.get_update_information,
-        "octoprint.comm.protocol.gcode.sent": __plugin_implementation__.sent_m117
+        "octoprint.comm.protocol.gcode.sent": __plugin_implementation__.sent_gcode
     }
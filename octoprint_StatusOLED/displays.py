@@ -13,7 +13,8 @@ import os
 import io
 import base64
 from PIL import Image, ImageDraw, ImageFont
-from threading import Thread
+from threading import Thread, Lock
+from collections import OrderedDict
 import time
 
 PIOLED_WIDTH = 128
@@ -23,6 +24,8 @@ ANIMATION_DELAY = 0.05   # 20fps
 ANIMATION_SPEED_XSLOW = 1
 ANIMATION_SPEED_XFAST = 18
 
+LINE_CACHE_SIZE = 128    # rendered lines, each message is cached in both fonts
+
 FONT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "static/ttf")
 
 class DisplayImage():
@@ -43,7 +46,16 @@ class DisplayImage():
         self._font = None
         self._secondary_font = None
         self._texts = []
+        self._lines = []
+        self._revision = 0
+        self._font_name = "default"
+        self._font_size = None
+        self._secondary_font_name = "default"
+        self._secondary_font_size = None
+        self._line_cache = OrderedDict()
+        self._line_cache_lock = Lock()
         self._progress = 0.0
+        self._progress_visible = False
         self._progress_bar_enabled = True
         self._progress_bar_outline = 0
         self._progress_bar_height = 6
@@ -53,6 +65,7 @@ class DisplayImage():
         self._animation_x = 0
         self._animation_y = 0
         self._animation_w = 0
+        self._animation_bitmap = None
         self._animation_loops = 0
         self._animation_signal = None
         self._animation_settings_loops = 0
@@ -71,14 +84,34 @@ class DisplayImage():
         progbar_enabled = True, progbar_outline = True, progbar_size = 6
     ):
         if font_name is not None and font_name != "default" and font_size is not None:
-            self._font = ImageFont.truetype(os.path.join(FONT_DIR, font_name), int(font_size))
+            font_key = (font_name, int(font_size))
         else:
-            self._font = ImageFont.load_default()
-
+            font_key = ("default", None)
         if sec_font_name is not None and sec_font_name != "default" and sec_font_size is not None:
-            self._secondary_font = ImageFont.truetype(os.path.join(FONT_DIR, sec_font_name), int(sec_font_size))
+            sec_font_key = (sec_font_name, int(sec_font_size))
         else:
-            self._secondary_font = ImageFont.load_default()
+            sec_font_key = ("default", None)
+
+        # only reload fonts that changed, so saving other settings keeps the cached lines
+        font = None
+        if self._font is None or font_key != (self._font_name, self._font_size):
+            font = self._load_font(*font_key)
+        sec_font = None
+        if self._secondary_font is None or sec_font_key != (self._secondary_font_name, self._secondary_font_size):
+            sec_font = self._load_font(*sec_font_key)
+
+        # swap fonts and keys under the cache lock so _line_font never pairs a font with another font's key
+        with self._line_cache_lock:
+            if font is not None:
+                self._font = font
+                self._font_name, self._font_size = font_key
+            if sec_font is not None:
+                self._secondary_font = sec_font
+                self._secondary_font_name, self._secondary_font_size = sec_font_key
+
+            # drop lines rendered in fonts no longer in use, changing a font mid-print loses those pre-rendered messages
+            for key in [key for key in self._line_cache if key[1:] not in [font_key, sec_font_key]]:
+                del self._line_cache[key]
 
         self._animation_settings_loops = animation_loops
         self._animation_settings_speed = animation_speed
@@ -93,44 +126,101 @@ class DisplayImage():
         if self._progress > 0:
             self.show_progress()
 
+    def _load_font(self, name, size):
+        if name == "default":
+            return ImageFont.load_default()
+        return ImageFont.truetype(os.path.join(FONT_DIR, name), size)
+
+    def _line_font(self, primary):
+        # the font and its cache key, read under the lock set_settings swaps them under
+        with self._line_cache_lock:
+            if primary:
+                return (self._font, (self._font_name, self._font_size))
+            return (self._secondary_font, (self._secondary_font_name, self._secondary_font_size))
+
     def show_text(self, text = None, signal_animation = None):
         # add text to head of array
         if text is not None:
             self._texts[0:0] = text.split("\n")
+            self._revision += 1
+            if signal_animation is None:
+                # nothing consumes animation frames, so don't leave an older message scrolling over this one
+                self._stop_animation()
 
         # clear the drawing to start
         self._draw.rectangle((0, 0, PIOLED_WIDTH, PIOLED_HEIGHT), outline=0, fill=0)
+        self._progress_visible = False
 
         # draw as many lines of text as will fit
+        lines = []
         index = 0
         ox, oy = (0, 0)
         while index < len(self._texts) and oy < PIOLED_HEIGHT - 2:
-            line_font = self._font if index == 0 else self._secondary_font
-            if hasattr(line_font, "getbbox"):
-                bbox = self._draw.textbbox((ox, oy), self._texts[index], font=line_font, anchor="lt")
-            else:
-                w, h = self._draw.textsize(self._texts[index], font=line_font)
-                bbox = (ox, oy, ox + w, oy + h)
-            bbx, bby, bbw, bbh = bbox
-            self._draw.text((ox, oy), self._texts[index], font=line_font, fill=1, anchor="lt")
+            bitmap, (bbx, bby, bbw, bbh), baseline = self._get_line_bitmap(self._texts[index], *self._line_font(index == 0))
+            bbx, bby, bbw, bbh = (ox + bbx, oy + bby, ox + bbw, oy + bbh)
+            self._monoImage.paste(1, (bbx, bby), bitmap)
+            lines.append({ "text": self._texts[index], "y": oy, "baseline": None if baseline is None else oy + baseline, "width": bbw - bbx })
             if index == 0 and signal_animation is not None:
                 if bbw > PIOLED_WIDTH:
                     if self._animation_settings_loops > 0:
                         self._logger.warn("Text '%s' is %dpx wide, will need to animate on a new thread..." % (self._texts[index], bbw))
-                        self._start_animation(bbx, bby, bbw - bbx, bbh - bby, signal_animation)
+                        self._start_animation(bbx, bby, bbw - bbx, bbh - bby, bitmap, signal_animation)
                     else:
                         self._logger.warn("Text '%s' is %dpx wide and will be truncated (animation disabled)" % (self._texts[index], bbw))
                 else:
                     self._stop_animation()
             oy = bbh + 1
             index += 1
+        self._lines = lines
+
+    def prerender_text(self, text):
+        # render the lines of a message into the line cache before it is shown
+        for line in text.split("\n"):
+            self._get_line_bitmap(line, *self._line_font(True))
+            self._get_line_bitmap(line, *self._line_font(False))
+
+    def _get_line_bitmap(self, text, font, font_key):
+        key = (text,) + font_key
+        with self._line_cache_lock:
+            cached = self._line_cache.get(key)
+            if cached is not None:
+                self._line_cache.move_to_end(key)
+                return cached
+
+        cached = self._render_line(text, font)
+        with self._line_cache_lock:
+            # skip caching if the font was replaced while this line was rendering
+            if font_key not in [(self._font_name, self._font_size), (self._secondary_font_name, self._secondary_font_size)]:
+                return cached
+            self._line_cache[key] = cached
+            while len(self._line_cache) > LINE_CACHE_SIZE:
+                self._line_cache.popitem(last=False)
+        return cached
+
+    def _render_line(self, text, font):
+        # returns a bitmap of the line cropped to its bounding box, that box relative to the text origin,
+        # and the baseline's offset from the origin (None if this Pillow can't measure it)
+        scratch = ImageDraw.Draw(Image.new("1", (1, 1)))
+        if hasattr(font, "getbbox"):
+            bbox = scratch.textbbox((0, 0), text, font=font, anchor="lt")
+            baseline = bbox[1] - scratch.textbbox((0, 0), text, font=font, anchor="ls")[1]
+        else:
+            w, h = scratch.textsize(text, font=font)
+            bbox = (0, 0, w, h)
+            baseline = None
+        bbx, bby, bbw, bbh = bbox
 
-    def _start_animation(self, x, y, width, height, signal):
+        bitmap = Image.new("1", (max(1, bbw - bbx), max(1, bbh - bby)), 0)
+        ImageDraw.Draw(bitmap).text((-bbx, -bby), text, font=font, fill=1, anchor="lt")
+        return (bitmap, bbox, baseline)
+
+    def _start_animation(self, x, y, width, height, bitmap, signal):
         # reset the animation parameters
         self._animation_x = x
         self._animation_y = y
         self._animation_w = width
         self._animation_h = height
+        self._animation_bitmap = bitmap
         self._animation_loops = self._animation_settings_loops
         self._animation_signal = signal
 
@@ -164,7 +254,7 @@ class DisplayImage():
                 self._animation_x = 0
                 self._stop_animation()
             self._draw.rectangle((0, self._animation_y, PIOLED_WIDTH, self._animation_h), outline=0, fill=0)
-            self._draw.text((self._animation_x, self._animation_y), self._texts[0], font=self._font, fill=1, anchor="lt")
+            self._monoImage.paste(1, (self._animation_x, self._animation_y), self._animation_bitmap)
             if self._animation_signal is not None:
                 self._animation_signal()
 
@@ -185,6 +275,31 @@ class DisplayImage():
         self._draw.rectangle((-1, PIOLED_HEIGHT - 2 - progheight, PIOLED_WIDTH + 1, PIOLED_HEIGHT + 1), outline=0, fill=1)
         self._draw.rectangle((0, PIOLED_HEIGHT - 1 - progheight, PIOLED_WIDTH-1, PIOLED_HEIGHT-1), outline=1, fill=0)
         self._draw.rectangle((1, PIOLED_HEIGHT - progheight, int(1 + ((PIOLED_WIDTH - 3) * progress / 100)), PIOLED_HEIGHT - 2), outline=self._progress_bar_outline, fill=1)
+        self._progress_visible = True
+
+    def get_state(self):
+        # everything a client needs to draw the current image itself, animation steps are left to the client
+        progress_bar = None
+        if self._progress_visible:
+            progress_bar = {
+                "progress": self._progress,
+                "height": min(PIOLED_HEIGHT, max(4, self._progress_bar_height)),
+                "outline": self._progress_bar_outline == 0
+            }
+        return {
+            "revision": self._revision,
+            "width": PIOLED_WIDTH,
+            "height": PIOLED_HEIGHT,
+            "lines": self._lines,
+            "font": { "name": self._font_name, "size": self._font_size },
+            "secondary_font": { "name": self._secondary_font_name, "size": self._secondary_font_size },
+            "animation": {
+                "loops": self._animation_settings_loops,
+                "speed": self._animation_settings_speed,
+                "delay": int(ANIMATION_DELAY * 1000)
+            },
+            "progress_bar": progress_bar
+        }
 
     def get_mono_image(self):
         return self._monoImage
@@ -223,6 +338,10 @@ class Display(ABC):
     def update():
         pass
 
+    @abstractmethod
+    def needs_frames():
+        pass
+
 class HardwareDisplay(Display):
     def __init__(self, img, enabled, rotated_180):
         self._logger = logging.getLogger(__name__+"."+self.__class__.__name__)
@@ -252,6 +371,9 @@ class HardwareDisplay(Display):
     def is_enabled(self):
         return HardwareDisplay.Available() and self._enabled
 
+    def needs_frames(self):
+        return self.is_enabled()
+
     def initDisplay(self):
         if not self.is_enabled():
             self.clear()
@@ -284,30 +406,45 @@ class HardwareDisplay(Display):
         self._disp.show()
 
 class SoftwareDisplay(Display):
-    def __init__(self, img, pushDisplayFunc, enabled):
+    def __init__(self, img, pushDisplayFunc, enabled, pushStateFunc = None, client_rendering = False):
         self._logger = logging.getLogger(__name__+"."+self.__class__.__name__)
 
         self._dispImg = img
         self._pushDisplayFunc = pushDisplayFunc
+        self._pushStateFunc = pushStateFunc
+        self._client_rendering = False
+        self._last_state = None
         self._cleared = Image.new("1", (PIOLED_WIDTH, PIOLED_HEIGHT), 0)
 
-        self.set_settings(enabled)
+        self.set_settings(enabled, client_rendering)
         self.clear()
 
     def debug(self, enabled):
         self._logger.setLevel(level=logging.DEBUG if enabled else logging.NOTSET)
 
-    def set_settings(self, enabled):
+    def set_settings(self, enabled, client_rendering = None):
         if enabled is not None:
             self._enabled = bool(enabled)
+        if client_rendering is not None:
+            self._client_rendering = bool(client_rendering) and self._pushStateFunc is not None
 
-        self._logger.info("SoftwareDisplay set to enabled {self._enabled}".format(**locals()))
+        self._logger.info("SoftwareDisplay set to enabled {self._enabled} client_rendering {self._client_rendering}".format(**locals()))
+        self._last_state = None
         self.update()
 
     def is_enabled(self):
         return self._enabled
 
+    def needs_frames(self):
+        # in client rendering mode the browser animates the state itself
+        return self.is_enabled() and not self._client_rendering
+
     def clear(self):
+        if self._client_rendering:
+            self._last_state = None
+            self._pushStateFunc(None)
+            return
+
         buffer = io.BytesIO()
         self._cleared.save(buffer, "PNG")
         img_base64 = bytes("data:image/png;base64,", encoding='utf-8') + base64.b64encode(buffer.getvalue())
@@ -317,5 +454,13 @@ class SoftwareDisplay(Display):
         if not self.is_enabled():
             return
 
+        if self._client_rendering:
+            # animation steps don't change the state, so only real changes are sent
+            state = self._dispImg.get_state()
+            if state != self._last_state:
+                self._last_state = state
+                self._pushStateFunc(state)
+            return
+
         img_base64 = bytes("data:image/png;base64,", encoding='utf-8') + base64.b64encode(self._dispImg.get_alpha_buffer().getvalue())
         self._pushDisplayFunc(img_base64)
@@ -0,0 +1,121 @@
+import logging
+import os
+import re
+from collections import deque
+from threading import Thread, Condition
+
+from octoprint_StatusOLED import displays
+
+# Matches M117 lines when scanning a G-code file, stopping at any comment
+M117_FILE_REGEX = re.compile(rb"\s*M117\s+([^;\r\n]*)", re.I)
+
+# Messages pre-rendered ahead of the print, each takes two line cache entries (one per font).
+# The headroom leaves room for messages that aren't in the file, like M118 or the host's own M117s,
+# and for messages the print has passed but not shown yet, so they aren't evicted before they're used.
+WINDOW_HEADROOM_MESSAGES = 8
+WINDOW_MESSAGES = displays.LINE_CACHE_SIZE // 2 - WINDOW_HEADROOM_MESSAGES
+
+# Scans a G-code file on a background thread and pre-renders its M117 messages into the
+# DisplayImage's line cache, staying at most WINDOW_MESSAGES messages ahead of the print
+class MessagePrerenderer():
+    def __init__(self, img):
+        self._logger = logging.getLogger(__name__+"."+self.__class__.__name__)
+
+        self._img = img
+        self._condition = Condition()
+        self._generation = 0
+        self._pending = deque()     # (file offset, text) of messages rendered but not yet shown
+        self._file_size = None
+
+    def debug(self, enabled):
+        self._logger.setLevel(level=logging.DEBUG if enabled else logging.NOTSET)
+
+    def start(self, path):
+        with self._condition:
+            self._reset()
+            generation = self._generation
+
+        thread = Thread(target=self._worker, args=(path, generation))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._reset()
+
+    def _reset(self):
+        # any running scan sees the new generation and exits
+        self._generation += 1
+        self._pending.clear()
+        self._file_size = None
+        self._condition.notify_all()
+
+    def message_shown(self, text):
+        # the print has reached this message, free its slot and any earlier ones that were skipped
+        with self._condition:
+            if text not in [pending_text for offset, pending_text in self._pending]:
+                return
+            while self._pending[0][1] != text:
+                self._pending.popleft()
+            self._pending.popleft()
+            self._condition.notify_all()
+
+    def print_progress(self, progress):
+        # OctoPrint's progress is the file position, so free slots the print has already read past
+        with self._condition:
+            if self._file_size is None or len(self._pending) == 0:
+                return
+            position = self._file_size * progress / 100.0
+            if self._pending[0][0] > position:
+                return
+            while len(self._pending) > 0 and self._pending[0][0] <= position:
+                self._pending.popleft()
+            self._condition.notify_all()
+
+    def _worker(self, path, generation):
+        # stream the file line by line so memory use doesn't grow with the file size
+        count = 0
+        offset = 0
+        try:
+            with open(path, "rb") as gcode_file:
+                with self._condition:
+                    if generation == self._generation:
+                        self._file_size = os.fstat(gcode_file.fileno()).st_size
+                for line in gcode_file:
+                    offset += len(line)
+                    if generation != self._generation:
+                        break
+                    match = M117_FILE_REGEX.match(line)
+                    if match is None:
+                        continue
+                    text = match.group(1).rstrip().decode("utf-8", errors="replace")
+                    if text == "":
+                        continue
+
+                    with self._condition:
+                        # wait for the print to catch up once the window is full
+                        waited = False
+                        while generation == self._generation and len(self._pending) >= WINDOW_MESSAGES:
+                            self._condition.wait()
+                            waited = True
+                        if generation != self._generation:
+                            break
+                        refresh = [pending_text for pending_offset, pending_text in self._pending] if waited else []
+                        self._pending.append((offset, text))
+                    try:
+                        # lines drawn since are newer in the LRU cache, so touch the pending messages
+                        # again to have those evicted first (this also re-renders any already evicted)
+                        for pending_text in refresh:
+                            self._img.prerender_text(pending_text)
+                        self._img.prerender_text(text)
+                    except Exception as e:
+                        self._logger.warning("Unable to pre-render M117 message '%s' from '%s': %s" % (text, path, e))
+                        return
+                    count += 1
+                else:
+                    self._logger.info("Pre-rendered %d M117 messages from '%s'" % (count, path))
+                    return
+        except (IOError, OSError) as e:
+            self._logger.warning("Unable to scan '%s' for M117 messages: %s" % (path, e))
+            return
+        self._logger.debug("M117 pre-render of '%s' stopped after %d messages" % (path, count))
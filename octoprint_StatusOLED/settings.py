@@ -25,5 +25,10 @@ DEFAULT_SETTINGS = {
     "software_display": {
         "enabled": True,
         "color": "00ffff",
+        "client_rendering": False,
+    },
+    "gcode": {
+        "m73_progress": True,
+        "m118_messages": False,
     },
 }
@@ -6,6 +6,8 @@
  */
 $(function() {
     const PLUGIN_IDENTIFIER = "StatusOLED";
+    const DEFAULT_FONT = "10px monospace";
+    const TEXT_ALPHA_THRESHOLD = 128;
 
     function StatusOLEDNavBarViewModel(parameters) {
         var self = this;
@@ -14,6 +16,22 @@ $(function() {
 
         self.enabled = ko.observable();
         self.color = ko.observable();
+        self.clientRendering = ko.observable();
+        self.remaining = ko.observable(null);
+
+        // minutes remaining reported by the slicer through M73 R, shown as the display's tooltip
+        self.remainingText = ko.pureComputed(function() {
+            var minutes = self.remaining();
+            if (minutes === null) { return null; }
+            minutes = Math.round(minutes);
+            if (minutes < 60) { return `${minutes} min remaining`; }
+            return `${Math.floor(minutes / 60)} h ${minutes % 60} min remaining`;
+        });
+
+        self.state = null;
+        self.fonts = {};
+        self.animation = null;
+        self.scratch = document.createElement("canvas");
 
         self.imageLoader = new Image();
         self.imageLoader.onload = function() {
@@ -23,27 +41,196 @@ $(function() {
 
         self.onBeforeBinding = function() {
             self.resetLocalSettings();
-
-            if (self.enabled()) {
-                setTimeout(function() {
-                    self.imageLoader.src = `api/plugin/${PLUGIN_IDENTIFIER}`;
-                }, 0);
-            }
+            self.requestDisplay();
         }
 
         self.onSettingsHidden = function () {
             self.resetLocalSettings();
+            self.requestDisplay();
         }
 
         self.resetLocalSettings = function() {
             var settings = self.settingsVM.settings.plugins.StatusOLED;
             self.enabled(settings.software_display.enabled());
             self.color("#" + settings.software_display.color());
+            self.clientRendering(settings.software_display.client_rendering());
+        }
+
+        self.requestDisplay = function() {
+            if (!self.enabled()) { return; }
+            setTimeout(function() {
+                if (self.clientRendering()) {
+                    $.getJSON(`api/plugin/${PLUGIN_IDENTIFIER}?state=true`, self.applyState);
+                } else {
+                    self.imageLoader.src = `api/plugin/${PLUGIN_IDENTIFIER}`;
+                }
+            }, 0);
         }
 
         self.onDataUpdaterPluginMessage = function(plugin, data) {
             if (plugin !== PLUGIN_IDENTIFIER || !self.enabled() || data.isSample) { return; }
-            self.img(data.display);
+            if (data.hasOwnProperty("remaining")) {
+                self.remaining(data.remaining);
+            } else if (data.hasOwnProperty("state")) {
+                self.applyState(data.state);
+            } else {
+                self.img(data.display);
+            }
+        }
+
+        /* Client-side Rendering */
+
+        self.applyState = function(state) {
+            var restart = !state || !self.state || state.revision !== self.state.revision;
+            self.state = state;
+            if (!state) {
+                self.stopAnimation();
+                self.draw();
+                return;
+            }
+
+            Promise.all([self.loadFont(state.font), self.loadFont(state.secondary_font)]).then(function() {
+                // a newer state may have arrived while the fonts were loading
+                if (self.state !== state) { return; }
+                if (restart) {
+                    self.startAnimation();
+                } else {
+                    self.draw();
+                }
+            });
+        }
+
+        self.loadFont = function(font) {
+            if (font.name === "default") { return Promise.resolve(); }
+            if (!self.fonts[font.name]) {
+                var face = new FontFace(self.fontFamily(font), `url(plugin/${PLUGIN_IDENTIFIER}/static/ttf/${encodeURIComponent(font.name)})`);
+                document.fonts.add(face);
+                self.fonts[font.name] = face.load().catch(function() {});
+            }
+            return self.fonts[font.name];
+        }
+
+        self.fontFamily = function(font) {
+            return `${PLUGIN_IDENTIFIER}-${font.name.replace(/\.ttf$/i, "")}`;
+        }
+
+        self.cssFont = function(font) {
+            if (font.name === "default") { return DEFAULT_FONT; }
+            return `${font.size}px "${self.fontFamily(font)}"`;
+        }
+
+        self.startAnimation = function() {
+            self.stopAnimation();
+
+            var state = self.state;
+            if (state.lines.length > 0 && state.lines[0].width > state.width && state.animation.loops > 0) {
+                self.animation = {
+                    x: 0,
+                    loops: state.animation.loops,
+                    steps: 0,
+                    start: performance.now(),
+                    frame: requestAnimationFrame(self.animate)
+                };
+            }
+            self.draw();
+        }
+
+        self.stopAnimation = function() {
+            if (self.animation) {
+                cancelAnimationFrame(self.animation.frame);
+                self.animation = null;
+            }
+        }
+
+        self.animate = function(now) {
+            var animation = self.animation;
+            var state = self.state;
+            if (!animation || !state) { return; }
+
+            // step at the same rate as the server's animation thread, catching up on skipped frames
+            var steps = Math.floor((now - animation.start) / state.animation.delay);
+            var running = true;
+            var changed = animation.steps < steps;
+            while (running && animation.steps < steps) {
+                animation.steps++;
+                animation.x -= state.animation.speed;
+                if (animation.x < -state.lines[0].width) {
+                    animation.loops--;
+                    animation.x = state.width;
+                }
+                if (animation.loops <= 0 && animation.x <= 0) {
+                    animation.x = 0;
+                    running = false;
+                }
+            }
+
+            if (changed) {
+                self.draw();
+            }
+            if (running) {
+                animation.frame = requestAnimationFrame(self.animate);
+            } else {
+                self.animation = null;
+            }
+        }
+
+        self.draw = function() {
+            var canvas = $("#navbar_plugin_StatusOLED canvas.oled-canvas")[0];
+            if (!canvas) { return; }
+
+            var width = canvas.width;
+            var height = canvas.height;
+            var lit = new Uint8Array(width * height);
+            var state = self.state;
+
+            if (state) {
+                // draw the text antialiased, then threshold it to match the 1-bit display
+                self.scratch.width = width;
+                self.scratch.height = height;
+                var ctx = self.scratch.getContext("2d", { willReadFrequently: true });
+                ctx.fillStyle = "#fff";
+                ctx.textBaseline = "alphabetic";
+                state.lines.forEach(function(line, index) {
+                    ctx.font = self.cssFont(index === 0 ? state.font : state.secondary_font);
+                    // the server's "lt" anchor puts the top of the ink at line.y
+                    var baseline = line.baseline;
+                    if (baseline === null) {
+                        baseline = line.y + Math.round(ctx.measureText(line.text).actualBoundingBoxAscent);
+                    }
+                    var x = (index === 0 && self.animation) ? self.animation.x : 0;
+                    ctx.fillText(line.text, x, baseline);
+                });
+                var text = ctx.getImageData(0, 0, width, height).data;
+                for (var i = 0; i < lit.length; i++) {
+                    lit[i] = text[i * 4 + 3] >= TEXT_ALPHA_THRESHOLD ? 1 : 0;
+                }
+
+                if (state.progress_bar) {
+                    self.drawProgressBar(lit, width, height, state.progress_bar);
+                }
+            }
+
+            // lit pixels are transparent so the container's color shows through
+            var out = canvas.getContext("2d").createImageData(width, height);
+            for (var j = 0; j < lit.length; j++) {
+                out.data[j * 4 + 3] = lit[j] ? 0 : 255;
+            }
+            canvas.getContext("2d").putImageData(out, 0, 0);
+        }
+
+        self.drawProgressBar = function(lit, width, height, bar) {
+            // same rectangles as DisplayImage.show_progress, with inclusive coordinates
+            var rect = function(x0, y0, x1, y1, outline, fill) {
+                for (var y = Math.max(0, y0); y <= Math.min(height - 1, y1); y++) {
+                    for (var x = Math.max(0, x0); x <= Math.min(width - 1, x1); x++) {
+                        var border = x === x0 || x === x1 || y === y0 || y === y1;
+                        lit[y * width + x] = border ? outline : fill;
+                    }
+                }
+            };
+            rect(-1, height - 2 - bar.height, width + 1, height + 1, 0, 1);
+            rect(0, height - 1 - bar.height, width - 1, height - 1, 1, 0);
+            rect(1, height - bar.height, Math.floor(1 + (width - 3) * bar.progress / 100), height - 2, bar.outline ? 0 : 1, 1);
         }
     }
 
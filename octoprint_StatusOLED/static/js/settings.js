@@ -32,6 +32,9 @@ $(function() {
         self.hw_rotated_180 = ko.observable();
         self.sw_enabled = ko.observable();
         self.sw_color = ko.observable();
+        self.sw_client_rendering = ko.observable();
+        self.gcode_m73_progress = ko.observable();
+        self.gcode_m118_messages = ko.observable();
         self.sw_color_value = ko.pureComputed({
             read: function () {
                 return self.sw_color().replace("#", "");
@@ -127,6 +130,9 @@ $(function() {
             self.settings.hardware_display.rotated_180(!!self.hw_rotated_180());
             self.settings.software_display.enabled(!!self.sw_enabled());
             self.settings.software_display.color(self.sw_color_value());
+            self.settings.software_display.client_rendering(!!self.sw_client_rendering());
+            self.settings.gcode.m73_progress(!!self.gcode_m73_progress());
+            self.settings.gcode.m118_messages(!!self.gcode_m118_messages());
             self.settings.display.font.name(self.font_name());
             self.settings.display.font.size(parseInt(self.font_size()));
             self.settings.display.secondary_font.name(self.sec_font_name());
@@ -156,6 +162,9 @@ $(function() {
             self.hw_rotated_180(self.settings.hardware_display.rotated_180());
             self.sw_enabled(self.settings.software_display.enabled());
             self.sw_color_value(self.settings.software_display.color());
+            self.sw_client_rendering(self.settings.software_display.client_rendering());
+            self.gcode_m73_progress(self.settings.gcode.m73_progress());
+            self.gcode_m118_messages(self.settings.gcode.m118_messages());
             self.font_name(self.settings.display.font.name());
             self.font_size(self.settings.display.font.size());
             self.sec_font_name(self.settings.display.secondary_font.name());